@@ -0,0 +1,31 @@
+"""Gunicorn settings for serving SENTRA in production:
+
+    gunicorn -c gunicorn_conf.py index:app
+
+The app is imported once in the master (preload_app), so the Detoxify and
+EasyOCR weights are loaded a single time and shared with the forked workers
+copy-on-write instead of being re-loaded per worker. That includes the ONNX
+Runtime session, as long as SENTRA_ORT_THREADS stays at 1 (set below): with
+more intra-op threads each worker has to reopen the session, and with it its own
+copy of the weights. Whisper is never shared: CTranslate2's worker threads don't
+survive the fork, so each worker loads it on its first transcription.
+"""
+import os
+
+# Inference thread pools are sized per worker process; see post_fork below
+os.environ.setdefault('SENTRA_ORT_THREADS', '1')
+
+bind = os.environ.get('SENTRA_BIND', '0.0.0.0:5000')
+workers = max(2, (os.cpu_count() or 1) // 2)
+worker_class = 'gthread'
+threads = 4
+preload_app = True
+# Uploads run OCR/speech recognition synchronously; allow for slow audio files
+timeout = 120
+
+
+def post_fork(server, worker):
+    # workers x torch threads > cores oversubscribes the CPU; concurrency comes
+    # from the worker processes, so each one gets a single intra-op thread
+    import torch
+    torch.set_num_threads(int(os.environ.get('SENTRA_TORCH_THREADS', '1')))
@@ -1,22 +1,306 @@
-from flask import Flask, request, jsonify, render_template_string
+import os
+# Sizes torch's OpenMP pool; must be set before torch is first imported
+os.environ.setdefault('OMP_NUM_THREADS', str(os.cpu_count() or 1))
+
+from flask import Flask, Request, Response, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 from detoxify import Detoxify
+import torch
 import easyocr
-import os
 import time
 from io import BytesIO
 import base64
 from PIL import Image
 import numpy as np
 import speech_recognition as sr
-from pydub import AudioSegment
+import subprocess
+import hashlib
+import gc
+import gzip
 import tempfile
+import stat
+import mmap
+from contextlib import contextmanager
+import threading
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_GRAY
+except ImportError:
+    TurboJPEG = None
+
+# Small uploads spool into a BytesIO and larger ones into a real temp file, so
+# handlers can take a zero-copy view of either (see upload_view)
+UPLOAD_SPOOL_LIMIT = 512 * 1024
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_LIMIT:
+            return BytesIO()
+        return tempfile.TemporaryFile('w+b')
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# ---------------- Result Caches ----------------
+class LRUCache:
+    """Small thread-safe LRU map from content digests to model outputs"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+def content_digest(data: bytes) -> bytes:
+    """16-byte blake2b digest used as a cache key, so long inputs are never stored as keys"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def text_digest(text: str) -> bytes:
+    """Digest of normalized text (the 'original' Detoxify model is uncased)"""
+    return content_digest(text.strip().lower().encode('utf-8', 'surrogatepass'))
+
+toxicity_cache = LRUCache(maxsize=4096)
+ocr_cache = LRUCache(maxsize=1024)
+stt_cache = LRUCache(maxsize=256)
+
+# Second, persistent level shared by restarts and worker processes when
+# diskcache (SQLite-backed, no extra service) is installed. diskcache unpickles
+# what it reads and the entries hold users' text, so the directory is private
+# to this user rather than a predictable path under /tmp.
+CACHE_DIR = os.environ.get('SENTRA_CACHE_DIR', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'sentra'))
+CACHE_TTL = 24 * 60 * 60  # seconds
+
+def private_dir(path: str) -> str:
+    """Create path as a 0700 directory, refusing one that another user could control"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a directory owned by this user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+disk_cache = None
+if diskcache is not None:
+    try:
+        disk_cache = diskcache.Cache(private_dir(CACHE_DIR), size_limit=2 ** 31)
+    except OSError as e:
+        print(f"Persistent cache disabled ({CACHE_DIR}): {e}")
+
+def memoized(namespace: str, key: bytes, memory: LRUCache, compute):
+    """Return the cached result for key from memory, then disk, else compute() and store it.
+
+    Exceptions from compute() propagate and nothing is cached for that key.
+    """
+    value = memory.get(key)
+    if value is not None:
+        return value
+    disk_key = (namespace, key.hex())
+    if disk_cache is not None:
+        value = disk_cache.get(disk_key)
+    if value is None:
+        value = compute()
+        if disk_cache is not None:
+            disk_cache.set(disk_key, value, expire=CACHE_TTL)
+    memory.set(key, value)
+    return value
+
+# ---------------- Model Loading ----------------
+# It's better to load the models once when the application starts. Each load
+# blocks on disk (and on first run, network) I/O, so they run concurrently.
+WHISPER_MODEL = os.environ.get('SENTRA_WHISPER_MODEL', 'small')
+
+with ThreadPoolExecutor(max_workers=2) as _loader:
+    _detox_future = _loader.submit(Detoxify, 'original')
+    _reader_future = _loader.submit(easyocr.Reader, ['en'], gpu=False)
+    detox_model = _detox_future.result()
+    reader = _reader_future.result()
+
 # ---------------- Toxicity Analyzer ----------------
-# It's better to load the model once when the application starts
-detox_model = Detoxify('original')
+# When onnxruntime is installed, Detoxify's BERT is exported to ONNX once and
+# served by ONNX Runtime: graph optimizations fuse the LayerNorm/GELU/MatMul
+# patterns and pick kernels specialized for this CPU. Otherwise the PyTorch
+# model is quantized and compiled in place.
+
+class _DetoxLogits(torch.nn.Module):
+    """Positional-argument wrapper returning plain logits, as torch.onnx.export needs"""
+
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)))[0]
+
+def _checkpoint_fingerprint() -> str:
+    """Short digest of the loaded Detoxify weights, so a changed checkpoint gets a fresh export"""
+    h = hashlib.blake2b(digest_size=8)
+    for name, tensor in detox_model.model.state_dict().items():
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().contiguous().numpy())
+    return h.hexdigest()
+
+def _atomic_write(path: str, write):
+    """Run write(tmp_path) on a unique temp file next to path, then move it into place"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _export_detox_onnx() -> str:
+    """Export Detoxify to ONNX with dynamic batch/sequence axes, once; returns the path to serve"""
+    # Exports are only trusted from the private cache directory and are named
+    # after the weights they came from
+    base = os.path.join(private_dir(CACHE_DIR), f'detoxify-original-{_checkpoint_fingerprint()}')
+    fp32_path = base + '.onnx'
+    int8_path = base + '.int8.onnx'
+    quantize = os.environ.get('SENTRA_QUANTIZE', '1') == '1'
+    path = int8_path if quantize else fp32_path
+    if os.path.exists(path):
+        return path
+
+    if not os.path.exists(fp32_path):
+        sample = detox_model.tokenizer(["warmup"], return_tensors='pt')
+        input_names = list(sample.keys())
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['logits'] = {0: 'batch'}
+        _atomic_write(fp32_path, lambda tmp_path: torch.onnx.export(
+            _DetoxLogits(detox_model.model, input_names).eval(),
+            tuple(sample[name] for name in input_names), tmp_path,
+            input_names=input_names, output_names=['logits'],
+            dynamic_axes=dynamic_axes, opset_version=17))
+
+    if quantize:
+        # int8 weights: roughly another 2x on CPUs with VNNI
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        _atomic_write(int8_path, lambda tmp_path: quantize_dynamic(
+            fp32_path, tmp_path, weight_type=QuantType.QInt8))
+    return path
+
+ORT_THREADS = int(os.environ.get('SENTRA_ORT_THREADS', os.cpu_count() or 1))
+
+def _load_onnx_session(path: str):
+    """Open an ONNX Runtime CPU session with all graph optimizations enabled"""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = ORT_THREADS
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+def _onnx_predict(texts: list) -> dict:
+    """Score texts with the ONNX session: {category: [score per text]}, like Detoxify.predict"""
+    encoded = detox_model.tokenizer(texts, return_tensors='np', truncation=True, padding=True)
+    feeds = {inp.name: encoded[inp.name].astype(np.int64) for inp in onnx_session.get_inputs()}
+    logits = onnx_session.run(None, feeds)[0]
+    scores = 1.0 / (1.0 + np.exp(-logits))
+    return {category: scores[:, i].tolist() for i, category in enumerate(detox_model.class_names)}
+
+def _optimize_torch_detox():
+    """Quantize and compile the PyTorch Detoxify model in place, then warm it up"""
+    # Dynamic int8 quantization of the Linear layers, which dominate BERT's CPU time.
+    # fbgemm uses VNNI int8 dot-product instructions where the CPU has them.
+    torch.set_num_threads(os.cpu_count() or 1)
+    if 'fbgemm' in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = 'fbgemm'
+    if os.environ.get('SENTRA_QUANTIZE', '1') == '1':
+        detox_model.model = torch.quantization.quantize_dynamic(
+            detox_model.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    # Compile the BERT encoder to fuse kernels and drop per-op Python dispatch.
+    # torch.compile keeps the keyword-argument call that Detoxify.predict makes,
+    # which a torch.jit.trace'd module would not accept.
+    if os.environ.get('SENTRA_TORCH_COMPILE', '1') == '1' and hasattr(torch, 'compile'):
+        eager_model = detox_model.model
+        try:
+            detox_model.model = torch.compile(eager_model, dynamic=True)
+            # Compilation happens on the first calls; pay for it here, not on a real
+            # request. dynamic=True still specializes batch size 1, so warm up both
+            # the single-text graph and the dynamic batched one.
+            with torch.inference_mode():
+                detox_model.predict("warmup")
+                detox_model.predict(["warmup", "a second warmup sentence"])
+        except Exception as e:
+            print(f"torch.compile unavailable, using eager Detoxify: {e}")
+            detox_model.model = eager_model
+    else:
+        # Fault in weights and allocator pools before the first real request
+        with torch.inference_mode():
+            detox_model.predict("warmup")
+
+onnx_session = None
+if ort is not None and os.environ.get('SENTRA_ONNX', '1') == '1':
+    try:
+        onnx_model_path = _export_detox_onnx()
+        onnx_session = _load_onnx_session(onnx_model_path)
+        _onnx_predict(["warmup"])
+    except Exception as e:
+        print(f"ONNX Runtime unavailable, using PyTorch Detoxify: {e}")
+        onnx_session = None
+    else:
+        # Only the tokenizer and class names are used from here on; drop the
+        # FP32 PyTorch weights instead of keeping them resident in every worker
+        detox_model.model = None
+        gc.collect()
+
+def _reload_onnx_session():
+    """ORT's thread pool doesn't survive a fork; give each child process its own session"""
+    global onnx_session
+    onnx_session = _load_onnx_session(onnx_model_path)
+
+if onnx_session is None:
+    _optimize_torch_detox()
+elif ORT_THREADS > 1:
+    os.register_at_fork(after_in_child=_reload_onnx_session)
+# With a single intra-op thread ORT runs on the calling thread and has no pool
+# to lose, so forked children keep the parent's session and share its weights
 
 # Real Detoxify categories used in both backend and frontend
 DETOXIFY_CATEGORIES = {
@@ -31,65 +315,308 @@ DETOXIFY_CATEGORIES = {
 # Threshold for considering a category as "detected"
 TOXICITY_THRESHOLD = 0.5
 
-def convert_float32_to_float(obj):
-    """Recursively convert float32 to float for JSON serialization"""
-    if isinstance(obj, dict):
-        return {key: convert_float32_to_float(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_float32_to_float(element) for element in obj]
-    elif isinstance(obj, np.float32):
-        return float(obj)
-    elif isinstance(obj, float):
-        return obj
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    else:
-        return obj
+# Verdicts differ per backend, weight precision and threshold, so all three are
+# part of the persistent cache key
+if onnx_session is not None:
+    TOXICITY_BACKEND = os.path.basename(onnx_model_path)
+else:
+    TOXICITY_BACKEND = 'torch-int8' if os.environ.get('SENTRA_QUANTIZE', '1') == '1' else 'torch-fp32'
+TOXICITY_CACHE_NAMESPACE = f'toxicity:{TOXICITY_BACKEND}:{TOXICITY_THRESHOLD}'
 
-def predict_detox(text: str) -> dict:
-    """Get actual Detoxify predictions"""
-    results = detox_model.predict(text)
-    return convert_float32_to_float(results)
+# Comfortably past BERT's 512-token window; keeps the tokenizer from scanning
+# megabytes of OCR output that would be truncated anyway
+MAX_TEXT_CHARS = 2000
 
-def analyze_toxicity(text: str) -> dict:
-    """Analyze text and return only detected categories with meaningful scores"""
-    raw_scores = predict_detox(text)
+# Concurrent requests are coalesced into one batched forward pass
+DETOX_MAX_BATCH = 16
+DETOX_MAX_WAIT = 0.008  # seconds to wait for more texts to join a batch
+DETOX_RESULT_TIMEOUT = 5  # seconds a request waits for its batch before giving up
+# Texts queued beyond this are refused at once instead of waiting out the timeout
+# for a forward pass whose result would be discarded
+DETOX_QUEUE_SIZE = 4 * DETOX_MAX_BATCH
 
-    detected_categories = {}
-    overall_score = 0
-    detected_count = 0
+# Detoxify's RSS creeps up under sustained traffic in a long-lived server;
+# periodically collect cycles and hand cached CUDA blocks back
+GC_EVERY_N_TEXTS = 500
 
-    for category, score in raw_scores.items():
-        if score >= TOXICITY_THRESHOLD:
-            detected_categories[category] = score
-            overall_score += score
-            detected_count += 1
+def submit_text(text: str) -> Future:
+    """Queue text for the batching worker and return a future for its verdict.
 
-    # Calculate weighted overall score
-    if detected_count > 0:
-        overall_score = (overall_score / detected_count) * 100
-    else:
-        # If no category is above the threshold, the overall score is based on the max score but scaled down
-        overall_score = max(raw_scores.values()) * 50
+    Raises queue.Full when DETOX_QUEUE_SIZE texts are already waiting.
+    """
+    future = Future()
+    detox_queue.put_nowait((text, future))
+    return future
+
+def predict_batch(texts: list) -> dict:
+    """Score a list of texts in one forward pass: {category: [score per text]}"""
+    if onnx_session is not None:
+        return _onnx_predict(texts)
+    # inference_mode (stricter than Detoxify's own no_grad) skips autograd
+    # bookkeeping entirely. A list input returns {category: [score per text]}.
+    with torch.inference_mode():
+        return detox_model.predict(texts)
+
+def _release_memory():
+    """Collect reference cycles and return cached allocator blocks"""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _detox_batch_worker():
+    """Drain up to DETOX_MAX_BATCH queued texts and score them with one predict call"""
+    scored_since_gc = 0
+    while True:
+        batch = [detox_queue.get()]
+        deadline = time.monotonic() + DETOX_MAX_WAIT
+        while len(batch) < DETOX_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(detox_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Skip texts whose callers already timed out and cancelled
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            continue
 
+        try:
+            results = predict_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+
+        # One vectorized pass over the whole (texts, categories) score matrix
+        categories = list(results)
+        scores = np.array([results[category] for category in categories], dtype=np.float64).T
+        mask, overall = score_verdicts(scores)
+        for row, (_, future) in enumerate(batch):
+            future.set_result(build_verdict(categories, scores[row], mask[row], overall[row]))
+
+        scored_since_gc += len(batch)
+        if scored_since_gc >= GC_EVERY_N_TEXTS:
+            scored_since_gc = 0
+            _release_memory()
+
+def _start_detox_worker():
+    """Start the batching thread with a fresh queue; threads don't survive a fork"""
+    global detox_queue
+    detox_queue = queue.Queue(maxsize=DETOX_QUEUE_SIZE)
+    threading.Thread(target=_detox_batch_worker, name='detox-batcher', daemon=True).start()
+
+_start_detox_worker()
+os.register_at_fork(after_in_child=_start_detox_worker)
+
+def predict_detox(text: str) -> dict:
+    """Get the toxicity verdict for text; raises queue.Full or FutureTimeoutError when the batcher is backlogged"""
+    future = submit_text(text)
+    try:
+        return future.result(timeout=DETOX_RESULT_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise
+
+def score_verdicts(scores: np.ndarray):
+    """Vectorized verdicts for an (N, categories) score matrix.
+
+    Returns the boolean detection mask and each row's overall score in percent:
+    the mean of detected scores, or half the max score when nothing is detected.
+    """
+    mask = scores >= TOXICITY_THRESHOLD
+    detected_count = mask.sum(axis=1)
+    summed = np.where(mask, scores, 0.0).sum(axis=1)
+    overall = np.where(detected_count > 0,
+                       100.0 * summed / np.maximum(detected_count, 1),
+                       scores.max(axis=1) * 50)
+    np.clip(overall, 0, 100, out=overall)  # Cap at 100%
+    return mask, overall
+
+def build_verdict(categories: list, scores: np.ndarray, detected: np.ndarray, overall: float) -> dict:
+    """Verdict dict for one row of score_verdicts' output"""
+    all_scores = dict(zip(categories, scores.tolist()))
+    detected_categories = {
+        category: all_scores[category]
+        for category, is_detected in zip(categories, detected) if is_detected
+    }
     return {
         "detected_categories": detected_categories,
-        "overall_score": min(overall_score, 100),  # Cap at 100%
-        "all_scores": raw_scores,
+        "overall_score": float(overall),
+        "all_scores": all_scores,
         "is_toxic": len(detected_categories) > 0
     }
 
+_EMPTY_SCORES = {category: 0.0 for category in DETOXIFY_CATEGORIES}
+_EMPTY_RESULT = {
+    "detected_categories": {},
+    "overall_score": 0.0,
+    "all_scores": _EMPTY_SCORES,
+    "is_toxic": False
+}
+
+def empty_toxicity_result() -> dict:
+    """Zero-score result for input with nothing to analyze"""
+    # Callers may mutate the result; don't hand out the shared nested dicts
+    return {**_EMPTY_RESULT, "detected_categories": {}, "all_scores": dict(_EMPTY_SCORES)}
+
+def analyze_toxicity(text: str) -> dict:
+    """Analyze text and return only detected categories with meaningful scores"""
+    if not text or not text.strip():
+        return empty_toxicity_result()
+
+    # Re-submitted text (including history reloads) is answered from the cache
+    text = text[:MAX_TEXT_CHARS]
+    result = memoized(TOXICITY_CACHE_NAMESPACE, text_digest(text), toxicity_cache,
+                      lambda: predict_detox(text))
+    # Routes add keys such as extracted_text; never hand out the cached dicts
+    return {
+        **result,
+        "detected_categories": dict(result["detected_categories"]),
+        "all_scores": dict(result["all_scores"])
+    }
+
 # ---------------- Image Text Extractor ----------------
-reader = easyocr.Reader(['en'], gpu=False)
+# Warm up the detector and recognizer so the first upload doesn't pay for it.
+# readtext only reaches the recognizer when the detector finds a box, so the
+# recognizer is also run directly: recognize() treats the whole image as one box.
+_warmup_image = np.full((32, 128), 255, dtype=np.uint8)
+_warmup_image[8:24, 16:20] = 0
+reader.readtext(_warmup_image, detail=0)
+reader.recognize(_warmup_image, detail=0)
 
-def extract_text_from_image(image_data) -> str:
-    """Extracts text from image data (bytes)"""
+# All OCR runs on one worker thread so EasyOCR's networks and buffers stay warm;
+# the bounded queue applies backpressure instead of piling up decoded images
+OCR_QUEUE_SIZE = 32
+
+def submit_image(img_np) -> Future:
+    """Queue a decoded image for the OCR worker and return a future for its lines"""
+    future = Future()
+    ocr_queue.put((img_np, future))
+    return future
+
+def _resolve(futures, compute):
+    """Set the result of compute() on every future, or its exception on failure"""
     try:
-        image = Image.open(BytesIO(image_data))
-        # Convert to numpy array for easyocr
-        img_np = np.array(image)
-        results = reader.readtext(img_np, detail=0)
+        results = compute()
+    except Exception as e:
+        for future in futures:
+            future.set_exception(e)
+        return
+    for future, result in zip(futures, results):
+        future.set_result(result)
+
+def _run_ocr_jobs(jobs):
+    """Run queued OCR jobs, batching same-sized images when the reader is on a GPU"""
+    if len(jobs) > 1 and reader.device != 'cpu' and hasattr(reader, 'readtext_batched'):
+        by_shape = {}
+        for job in jobs:
+            by_shape.setdefault(job[0].shape, []).append(job)
+        jobs = []
+        for group in by_shape.values():
+            if len(group) == 1:
+                jobs.extend(group)
+                continue
+            images = [img for img, _ in group]
+            _resolve([future for _, future in group],
+                     lambda: reader.readtext_batched(images, detail=0))
+
+    for img_np, future in jobs:
+        _resolve([future], lambda: [reader.readtext(img_np, detail=0)])
+
+def _ocr_worker():
+    """Serve OCR jobs from ocr_queue for the lifetime of the process"""
+    while True:
+        jobs = [ocr_queue.get()]
+        while True:
+            try:
+                jobs.append(ocr_queue.get_nowait())
+            except queue.Empty:
+                break
+        _run_ocr_jobs(jobs)
+
+def _start_ocr_worker():
+    """Start the OCR thread with a fresh queue; threads don't survive a fork"""
+    global ocr_queue
+    ocr_queue = queue.Queue(maxsize=OCR_QUEUE_SIZE)
+    threading.Thread(target=_ocr_worker, name='ocr-worker', daemon=True).start()
+
+_start_ocr_worker()
+os.register_at_fork(after_in_child=_start_ocr_worker)
+
+# libjpeg-turbo (SIMD) for JPEG uploads when PyTurboJPEG and its shared library are present
+JPEG_MAGIC = b'\xff\xd8\xff'
+try:
+    jpeg = TurboJPEG() if TurboJPEG is not None else None
+except (OSError, RuntimeError):
+    jpeg = None
+
+# EasyOCR's runtime scales with pixel area; moderation text stays readable at this size
+OCR_MAX_SIDE = 1600
+
+def shrink_to_fit(image: Image.Image) -> Image.Image:
+    """Downscale so the longer edge is at most OCR_MAX_SIDE pixels"""
+    scale = min(1.0, OCR_MAX_SIDE / max(image.size))
+    if scale < 1:
+        width, height = image.size
+        image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.BILINEAR)
+    return image
+
+def _jpeg_scaling_factor(longest_side: int):
+    """Smallest libjpeg-turbo DCT scale that still keeps the image at least OCR_MAX_SIDE"""
+    factors = [(num, denom) for num, denom in jpeg.scaling_factors
+               if num <= denom and longest_side * num / denom >= OCR_MAX_SIDE]
+    return min(factors, key=lambda f: f[0] / f[1], default=None)
+
+def stretch_contrast(gray: np.ndarray) -> np.ndarray:
+    """Stretch the 2nd-98th percentile intensity range of a uint8 image to 0-255.
+
+    Percentiles come from a 256-bin histogram (one pass, no sort) and the
+    stretch is applied as a lookup table.
+    """
+    cdf = np.cumsum(np.bincount(gray.ravel(), minlength=256))
+    lo, hi = np.searchsorted(cdf, (0.02 * cdf[-1], 0.98 * cdf[-1]))
+    if hi <= lo:
+        return gray
+    lut = np.clip((np.arange(256) - lo) * 255 // (hi - lo), 0, 255).astype(np.uint8)
+    return lut[gray]
+
+def _decode_gray(image_data) -> np.ndarray:
+    """Decode image bytes into a grayscale uint8 array capped at OCR_MAX_SIDE"""
+    if jpeg is not None and image_data[:3] == JPEG_MAGIC:
+        width, height, _, _ = jpeg.decode_header(image_data)
+        img_np = jpeg.decode(image_data, pixel_format=TJPF_GRAY,
+                             scaling_factor=_jpeg_scaling_factor(max(width, height)))[:, :, 0]
+        if max(img_np.shape) <= OCR_MAX_SIDE:
+            return img_np
+        return np.asarray(shrink_to_fit(Image.fromarray(img_np)))
+
+    image = Image.open(BytesIO(image_data))
+    # JPEGs decode at a reduced DCT scale (no-op for other formats)
+    image.draft('L', (OCR_MAX_SIDE, OCR_MAX_SIDE))
+    return np.asarray(shrink_to_fit(image.convert('L')))
+
+def decode_image(image_data) -> np.ndarray:
+    """Decode image bytes into the contrast-stretched grayscale array fed to EasyOCR"""
+    # Color doesn't help text detection: one channel moves 3x fewer bytes, and
+    # EasyOCR accepts 2-D input directly. Stretching helps low-contrast screenshots.
+    return stretch_contrast(_decode_gray(image_data))
+
+# OCR output depends on how the image was prepared, so the persistent key names
+# the size cap, the contrast stretch and the JPEG decoder. Bump the version tag
+# whenever preprocessing changes.
+OCR_CACHE_NAMESPACE = f"ocr:{OCR_MAX_SIDE}:stretch:{'turbojpeg' if jpeg is not None else 'pillow'}:v1"
+
+def extract_text_from_image(image_data) -> str:
+    """Extracts text from image data (bytes or a buffer view)"""
+    def run_ocr():
+        results = submit_image(decode_image(image_data)).result()
         return "\n".join(results) if results else "No text detected in image"
+
+    try:
+        return memoized(OCR_CACHE_NAMESPACE, content_digest(image_data), ocr_cache, run_ocr)
     except Exception as e:
         return f"Error extracting text: {str(e)}"
 
@@ -98,27 +625,70 @@ def allowed_audio_file(filename):
     """Check if the audio file format is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'wav', 'mp3', 'm4a', 'flac', 'aac'}
 
+# Whisper runs locally when faster-whisper is installed; Google Speech Recognition
+# is the fallback. CTranslate2 starts its worker threads when the model is built
+# and threads don't survive a fork, so each process loads Whisper on first use
+# rather than inheriting one from a preloading gunicorn master.
+_stt_model = None
+_stt_model_lock = threading.Lock()
+
+def get_stt_model():
+    """This process's local int8 Whisper (CTranslate2) model, loaded on first use"""
+    global _stt_model
+    if _stt_model is None:
+        with _stt_model_lock:
+            if _stt_model is None:
+                _stt_model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8", num_workers=4)
+    return _stt_model
+
+# One Recognizer shared across requests; recognize_google keeps no per-call state on it
+recognizer = sr.Recognizer()
+
+# 16 kHz mono 16-bit PCM is what both Whisper and Google's recognizer expect
+STT_SAMPLE_RATE = 16000
+# cache:pipe:0 buffers stdin so ffmpeg can seek, which MP4/M4A containers
+# with a trailing moov atom need
+FFMPEG_DECODE_CMD = [
+    'ffmpeg', '-loglevel', 'error', '-i', 'cache:pipe:0',
+    '-ac', '1', '-ar', str(STT_SAMPLE_RATE), '-f', 's16le', 'pipe:1'
+]
+
+def decode_audio(audio_data) -> bytes:
+    """Decode any ffmpeg-readable audio straight to raw 16 kHz mono int16 PCM"""
+    proc = subprocess.run(FFMPEG_DECODE_CMD, input=audio_data, capture_output=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode(errors='replace').strip() or 'ffmpeg failed to decode audio')
+    return proc.stdout
+
+def transcribe(audio_data) -> str:
+    """Transcribe audio; raises sr.UnknownValueError when no speech is recognized"""
+    # One ffmpeg pass streams PCM into memory: no pydub re-encode or temp file
+    pcm = decode_audio(audio_data)
+    if not pcm:
+        raise sr.UnknownValueError()
+
+    if WhisperModel is not None:
+        samples = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        segments, _ = get_stt_model().transcribe(samples, language='en', beam_size=1, vad_filter=True)
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    audio = sr.AudioData(pcm, sample_rate=STT_SAMPLE_RATE, sample_width=2)
+    return recognizer.recognize_google(audio)
+
 def speech_to_text(audio_data, original_filename):
-    """Convert speech audio to text using Google Speech Recognition"""
-    recognizer = sr.Recognizer()
+    """Convert speech audio to text with local Whisper, or Google Speech Recognition"""
     try:
-        # Use pydub to open audio file from memory
-        audio_segment = AudioSegment.from_file(BytesIO(audio_data))
-        
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as temp_wav:
-            audio_segment.export(temp_wav.name, format="wav")
-            
-            with sr.AudioFile(temp_wav.name) as source:
-                recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = recognizer.record(source)
-                
-                try:
-                    return recognizer.recognize_google(audio)
-                except sr.UnknownValueError:
-                    return "Could not understand audio"
-                except sr.RequestError as e:
-                    return f"Speech recognition error: {str(e)}"
-
+        # Transcripts differ per backend, so it is part of the persistent key
+        backend = f"whisper-{WHISPER_MODEL}" if WhisperModel is not None else "google"
+        return memoized(f'stt:{backend}', content_digest(audio_data), stt_cache,
+                        lambda: transcribe(audio_data))
+    except sr.UnknownValueError:
+        return "Could not understand audio"
+    except sr.RequestError as e:
+        return f"Speech recognition error: {str(e)}"
     except Exception as e:
         return f"Audio processing error: {str(e)}"
 
@@ -750,7 +1320,7 @@ frontend_html = """
                         <div class="upload-icon">🖼️</div>
                         <p>Drag & drop an image or click to browse</p>
                         <p style="font-size: 0.9rem; color: var(--gray-light); margin-top: 5px;">
-                            Supports JPG, PNG, GIF (Max 16MB)
+                            Supports JPG, PNG, GIF (Max 8MB)
                         </p>
                     </div>
                     <img id="image-preview" class="image-preview" alt="Image preview">
@@ -797,6 +1367,21 @@ frontend_html = """
                     <div id="history-list">
                         <!-- History items will be populated here -->
                     </div>
+                    <template id="history-item-tpl">
+                        <div class="history-item">
+                            <div style="display: flex; justify-content: space-between; align-items: center;">
+                                <div>
+                                    <strong class="history-title"></strong>
+                                    <div class="history-preview" style="font-size: 0.9rem; color: var(--gray-light); margin-top: 5px;"></div>
+                                </div>
+                                <div style="text-align: right;">
+                                    <div class="overall-score history-score" style="font-size: 1.5rem;"></div>
+                                    <span class="detection-status"></span>
+                                </div>
+                            </div>
+                            <div class="history-time" style="font-size: 0.8rem; color: var(--gray-light); margin-top: 10px;"></div>
+                        </div>
+                    </template>
                     <button class="btn" onclick="clearHistory()" style="margin-top: 15px; background: rgba(239, 68, 68, 0.2); color: #fca5a5;">
                         🗑️ Clear History
                     </button>
@@ -816,11 +1401,22 @@ frontend_html = """
         let currentTab = 'text';
         let currentImage = null;
         let currentAudio = null;
-        let analysisHistory = JSON.parse(localStorage.getItem('sentra_history')) || [];
+        // History entries carry an in-memory id that keys their rendered node,
+        // so adds and evictions touch only the affected items
+        let nextHistoryId = 0;
+        const historyNodes = new Map();
+        // Filled from IndexedDB by loadHistory() once the page is up
+        let analysisHistory = [];
         
         // Initialize history display
         updateHistoryDisplay();
         
+        // One delegated listener serves every history item, however often the list is rebuilt
+        document.getElementById('history-list').addEventListener('click', (e) => {
+            const el = e.target.closest('.history-item');
+            if (el) loadHistoryItem(el.dataset.id);
+        });
+        
         function switchTab(tabName) {
             // Hide all tabs
             document.querySelectorAll('.tab-content').forEach(tab => {
@@ -897,6 +1493,32 @@ frontend_html = """
             });
         }
         
+        // The server never OCRs more than 1600px on the longer side, so larger
+        // photos are re-encoded to that size in the browser before upload
+        const UPLOAD_MAX_SIDE = 1600;
+        
+        function downscaleImage(file) {
+            if (typeof createImageBitmap !== 'function' || typeof OffscreenCanvas !== 'function') {
+                return Promise.resolve(file);
+            }
+            return createImageBitmap(file)
+            .then(bitmap => {
+                const scale = UPLOAD_MAX_SIDE / Math.max(bitmap.width, bitmap.height);
+                if (scale >= 1) {
+                    bitmap.close();
+                    return file;
+                }
+                const canvas = new OffscreenCanvas(Math.round(bitmap.width * scale), Math.round(bitmap.height * scale));
+                const ctx = canvas.getContext('2d');
+                ctx.imageSmoothingQuality = 'high';
+                ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+                bitmap.close();
+                return canvas.convertToBlob({ type: 'image/jpeg', quality: 0.85 })
+                    .then(blob => blob.size < file.size ? blob : file);
+            })
+            .catch(() => file);
+        }
+        
         function analyzeImage() {
             if (!currentImage) {
                 showAlert('Please select an image first.', 'error');
@@ -905,12 +1527,14 @@ frontend_html = """
             
             setLoading(true);
             
-            const formData = new FormData();
-            formData.append('image', currentImage);
-            
-            fetch('/analyze/image', {
-                method: 'POST',
-                body: formData
+            downscaleImage(currentImage)
+            .then(upload => {
+                const formData = new FormData();
+                formData.append('image', upload, upload.name || 'image.jpg');
+                return fetch('/analyze/image', {
+                    method: 'POST',
+                    body: formData
+                });
             })
             .then(response => {
                 if (!response.ok) {
@@ -988,56 +1612,213 @@ frontend_html = """
         }
         
         function addToHistory(analysis) {
+            analysis.id = 'h' + nextHistoryId++;
             analysisHistory.unshift(analysis);
             // Keep only last 10 analyses
-            if (analysisHistory.length > 10) {
-                analysisHistory = analysisHistory.slice(0, 10);
+            analysisHistory.splice(10).forEach(evicted => {
+                historyNodes.get(evicted.id).remove();
+                historyNodes.delete(evicted.id);
+            });
+            if (encodedHistory !== null) {
+                encodedHistory.unshift(encodeHistoryEntry(analysis));
+                encodedHistory.length = analysisHistory.length;
+            }
+            scheduleHistoryWrite();
+            
+            const historyList = document.getElementById('history-list');
+            // The first entry replaces the empty-history placeholder
+            if (analysisHistory.length === 1) historyList.replaceChildren();
+            historyList.prepend(renderHistoryItem(analysis));
+        }
+        
+        // Persist history when the browser is idle instead of blocking the main
+        // thread on every add; bursts of analyses coalesce into a single write
+        let historyWritePending = false;
+        
+        // Encoded form of each stored entry, parallel to analysisHistory, so an
+        // add only encodes the new entry. Built lazily on the first write.
+        let encodedHistory = null;
+        // Writes wait for the stored history to be loaded and merged, so an
+        // early analysis can't overwrite it
+        let historyLoaded = false;
+        
+        function flushHistoryWrite() {
+            if (!historyWritePending || !historyLoaded) return;
+            historyWritePending = false;
+            if (encodedHistory === null) {
+                historyCatKeys = [];
+                encodedHistory = analysisHistory.map(encodeHistoryEntry);
+            }
+            const record = { catKeys: historyCatKeys, items: encodedHistory };
+            // IndexedDB stores the record by structured clone, asynchronously;
+            // localStorage is only the fallback where IndexedDB is unavailable
+            idbSet('sentra_history', record)
+            .catch(() => localStorage.setItem('sentra_history', JSON.stringify(record)));
+        }
+        
+        // Minimal promise wrapper over IndexedDB: a single key/value object store
+        const HISTORY_DB_NAME = 'sentra';
+        const HISTORY_STORE = 'kv';
+        let historyDB = null;
+        
+        function openHistoryDB() {
+            if (historyDB === null) {
+                historyDB = new Promise((resolve, reject) => {
+                    const req = indexedDB.open(HISTORY_DB_NAME, 1);
+                    req.onupgradeneeded = () => req.result.createObjectStore(HISTORY_STORE);
+                    req.onsuccess = () => resolve(req.result);
+                    req.onerror = () => reject(req.error);
+                });
+            }
+            return historyDB;
+        }
+        
+        function idbRequest(mode, makeRequest) {
+            return openHistoryDB().then(db => new Promise((resolve, reject) => {
+                const tx = db.transaction(HISTORY_STORE, mode);
+                const req = makeRequest(tx.objectStore(HISTORY_STORE));
+                tx.oncomplete = () => resolve(req.result);
+                tx.onerror = tx.onabort = () => reject(tx.error);
+            }));
+        }
+        
+        function idbGet(key) {
+            return idbRequest('readonly', store => store.get(key));
+        }
+        
+        function idbSet(key, value) {
+            return idbRequest('readwrite', store => store.put(value, key));
+        }
+        
+        function idbDelete(key) {
+            return idbRequest('readwrite', store => store.delete(key));
+        }
+        
+        function loadHistory() {
+            idbGet('sentra_history')
+            .then(stored => {
+                if (stored !== undefined) return stored;
+                // One-time move of history saved to localStorage by earlier versions
+                const legacy = JSON.parse(localStorage.getItem('sentra_history'));
+                if (!legacy) return null;
+                return idbSet('sentra_history', legacy).then(() => {
+                    localStorage.removeItem('sentra_history');
+                    return legacy;
+                });
+            })
+            .catch(() => JSON.parse(localStorage.getItem('sentra_history')))
+            .then(stored => {
+                const loaded = decodeHistory(stored);
+                loaded.forEach(item => { item.id = 'h' + nextHistoryId++; });
+                // Keep anything analyzed while the load was in flight on top
+                analysisHistory = analysisHistory.concat(loaded).slice(0, 10);
+                encodedHistory = null;
+                updateHistoryDisplay();
+                historyLoaded = true;
+                flushHistoryWrite();
+            });
+        }
+        
+        // Stored form: category names once in catKeys, each entry's scores as a
+        // dense array aligned to them and its detected categories as indexes.
+        // The dictionary comes from the scores themselves and only ever grows,
+        // so entries encoded earlier keep valid indexes (their sc may be shorter).
+        const HISTORY_TEXT_LIMIT = 500;
+        let historyCatKeys = [];
+        
+        function encodeHistoryEntry(item) {
+            const results = item.results;
+            const scores = results.all_scores || {};
+            const detected = Object.keys(results.detected_categories || {});
+            Object.keys(scores).concat(detected).forEach(key => {
+                if (!historyCatKeys.includes(key)) historyCatKeys.push(key);
+            });
+            return {
+                t: item.type,
+                ts: item.timestamp,
+                c: item.content,
+                sc: historyCatKeys.map(key => scores[key] || 0),
+                det: detected.map(key => historyCatKeys.indexOf(key)),
+                tox: results.is_toxic ? 1 : 0,
+                o: results.overall_score || 0,
+                x: results.extracted_text ? results.extracted_text.substring(0, HISTORY_TEXT_LIMIT) : undefined
+            };
+        }
+        
+        function decodeHistory(stored) {
+            if (!stored) return [];
+            // History saved before it was dictionary-encoded
+            if (Array.isArray(stored)) return stored;
+            
+            const catKeys = stored.catKeys || [];
+            return (stored.items || []).map(entry => {
+                const allScores = {};
+                entry.sc.forEach((score, i) => { allScores[catKeys[i]] = score; });
+                const detectedCategories = {};
+                entry.det.forEach(i => { detectedCategories[catKeys[i]] = entry.sc[i]; });
+                
+                const results = {
+                    overall_score: entry.o,
+                    is_toxic: !!entry.tox,
+                    detected_categories: detectedCategories,
+                    all_scores: allScores
+                };
+                if (entry.x !== undefined) results.extracted_text = entry.x;
+                return { type: entry.t, content: entry.c, results: results, timestamp: entry.ts };
+            });
+        }
+        
+        function scheduleHistoryWrite() {
+            if (historyWritePending) return;
+            historyWritePending = true;
+            if ('requestIdleCallback' in window) {
+                requestIdleCallback(flushHistoryWrite, { timeout: 1000 });
+            } else {
+                setTimeout(flushHistoryWrite, 0);
             }
-            localStorage.setItem('sentra_history', JSON.stringify(analysisHistory));
-            updateHistoryDisplay();
         }
         
+        // Don't lose a pending write when the tab is closed
+        window.addEventListener('pagehide', flushHistoryWrite);
+        
+        // Full rebuild, used on load and when history is cleared
         function updateHistoryDisplay() {
             const historyList = document.getElementById('history-list');
+            historyNodes.clear();
             if (analysisHistory.length === 0) {
                 historyList.innerHTML = '<p style="text-align: center; color: var(--gray-light); padding: 40px;">No analysis history yet.</p>';
                 return;
             }
             
-            historyList.innerHTML = analysisHistory.map((item, index) => {
-                const overallScore = item.results.overall_score || 0;
-                const isToxic = item.results.is_toxic || false;
-                const typeIcon = item.type === 'text' ? '📝' : item.type === 'image' ? '🖼️' : '🎤';
-                const contentPreview = (item.content || '').substring(0, 100) + ((item.content || '').length > 100 ? '...' : '');
-
-                // ***FIXED ERROR HERE***
-                // The stray '<div...>' tag before the return statement was removed.
-                return `
-                <div class="history-item" onclick="loadHistoryItem(${index})">
-                    <div style="display: flex; justify-content: space-between; align-items: center;">
-                        <div>
-                            <strong>${typeIcon} ${item.type.charAt(0).toUpperCase() + item.type.slice(1)} Analysis</strong>
-                            <div style="font-size: 0.9rem; color: var(--gray-light); margin-top: 5px;">
-                                ${contentPreview}
-                            </div>
-                        </div>
-                        <div style="text-align: right;">
-                            <div class="overall-score" style="font-size: 1.5rem;">${overallScore.toFixed(1)}%</div>
-                            <span class="detection-status ${isToxic ? 'status-detected' : 'status-clean'}">
-                                ${isToxic ? '🚨 Toxic' : '✅ Clean'}
-                            </span>
-                        </div>
-                    </div>
-                    <div style="font-size: 0.8rem; color: var(--gray-light); margin-top: 10px;">
-                        ${new Date(item.timestamp).toLocaleString()}
-                    </div>
-                </div>
-                `;
-            }).join('');
-        }
-        
-        function loadHistoryItem(index) {
-            const item = analysisHistory[index];
+            const fragment = document.createDocumentFragment();
+            analysisHistory.forEach(item => fragment.appendChild(renderHistoryItem(item)));
+            historyList.replaceChildren(fragment);
+        }
+        
+        // Clone a parsed template and fill it through textContent: no HTML
+        // parsing per item, and history content can't inject markup
+        function renderHistoryItem(item) {
+            const overallScore = item.results.overall_score || 0;
+            const isToxic = item.results.is_toxic || false;
+            const typeIcon = item.type === 'text' ? '📝' : item.type === 'image' ? '🖼️' : '🎤';
+            const contentPreview = (item.content || '').substring(0, 100) + ((item.content || '').length > 100 ? '...' : '');
+            
+            const node = document.getElementById('history-item-tpl').content.firstElementChild.cloneNode(true);
+            node.dataset.id = item.id;
+            node.querySelector('.history-title').textContent =
+                `${typeIcon} ${item.type.charAt(0).toUpperCase() + item.type.slice(1)} Analysis`;
+            node.querySelector('.history-preview').textContent = contentPreview;
+            node.querySelector('.history-score').textContent = formatPercent(overallScore);
+            const status = node.querySelector('.detection-status');
+            status.classList.add(isToxic ? 'status-detected' : 'status-clean');
+            status.textContent = isToxic ? '🚨 Toxic' : '✅ Clean';
+            node.querySelector('.history-time').textContent = new Date(item.timestamp).toLocaleString();
+            historyNodes.set(item.id, node);
+            return node;
+        }
+        
+        function loadHistoryItem(id) {
+            const item = analysisHistory.find(entry => entry.id === id);
             if (!item) return;
             
             // Switch to the appropriate tab
@@ -1049,14 +1830,10 @@ frontend_html = """
                 displayTextResults(item.results);
             } else if (item.type === 'image') {
                 // For images, we can't reload the image file, but we can show the results
-                const resultsDiv = document.getElementById('image-results');
-                resultsDiv.innerHTML = createImageResultsHTML(item.results);
-                resultsDiv.classList.add('show');
+                displayImageResults(item.results);
             } else if (item.type === 'audio') {
                 // For audio, similarly show the results
-                const resultsDiv = document.getElementById('audio-results');
-                resultsDiv.innerHTML = createAudioResultsHTML(item.results);
-                resultsDiv.classList.add('show');
+                displayAudioResults(item.results);
             }
             
             showAlert('History item loaded successfully!', 'success');
@@ -1065,28 +1842,46 @@ frontend_html = """
         function clearHistory() {
             if (confirm('Are you sure you want to clear all analysis history?')) {
                 analysisHistory = [];
+                encodedHistory = [];
+                historyCatKeys = [];
+                idbDelete('sentra_history').catch(() => {});
                 localStorage.removeItem('sentra_history');
                 updateHistoryDisplay();
                 showAlert('History cleared successfully!', 'success');
             }
         }
         
+        // Markup is built immediately; the DOM write and the reveal land together
+        // in the next frame so they cost a single layout pass
+        function showResults(resultsId, html) {
+            requestAnimationFrame(() => {
+                const resultsDiv = document.getElementById(resultsId);
+                resultsDiv.innerHTML = html;
+                resultsDiv.classList.add('show');
+            });
+        }
+        
         function displayTextResults(data) {
-            const resultsDiv = document.getElementById('text-results');
-            resultsDiv.innerHTML = createResultsHTML(data);
-            resultsDiv.classList.add('show');
+            showResults('text-results', createResultsHTML(data));
         }
         
         function displayImageResults(data) {
-            const resultsDiv = document.getElementById('image-results');
-            resultsDiv.innerHTML = createImageResultsHTML(data);
-            resultsDiv.classList.add('show');
+            showResults('image-results', createImageResultsHTML(data));
         }
         
         function displayAudioResults(data) {
-            const resultsDiv = document.getElementById('audio-results');
-            resultsDiv.innerHTML = createAudioResultsHTML(data);
-            resultsDiv.classList.add('show');
+            showResults('audio-results', createAudioResultsHTML(data));
+        }
+        
+        // One decimal place without going through toFixed's formatter
+        function formatPercent(value) {
+            return Math.round(value * 10) / 10 + '%';
+        }
+        
+        const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+        
+        function escapeHTML(text) {
+            return String(text).replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
         }
         
         function createResultsHTML(data) {
@@ -1095,45 +1890,38 @@ frontend_html = """
             const detectedCategories = data.detected_categories || {};
             const allScores = data.all_scores || {};
             
-            return `
-            <div class="toxicity-meter">
-                <div class="overall-score">${overallScore.toFixed(1)}%</div>
-                <div class="score-label">Overall Toxicity Score</div>
-                <div class="meter-bar">
-                    <div class="meter-fill" style="width: ${overallScore}%"></div>
-                </div>
-                <div class="verdict-badge ${isToxic ? 'verdict-toxic' : 'verdict-safe'}">
-                    ${isToxic ? '🚨 TOXIC CONTENT DETECTED' : '✅ CONTENT IS CLEAN'}
-                </div>
-            </div>
+            // Collect fragments and join once instead of building a string per card
+            const parts = [
+                '<div class="toxicity-meter"><div class="overall-score">', formatPercent(overallScore),
+                '</div><div class="score-label">Overall Toxicity Score</div><div class="meter-bar"><div class="meter-fill" style="width: ',
+                overallScore, '%"></div></div>',
+                isToxic
+                    ? '<div class="verdict-badge verdict-toxic">🚨 TOXIC CONTENT DETECTED</div>'
+                    : '<div class="verdict-badge verdict-safe">✅ CONTENT IS CLEAN</div>',
+                '</div><div class="category-grid">'
+            ];
             
-            <div class="category-grid">
-                ${Object.keys(DETOXIFY_CATEGORIES).map(category => {
-                    const score = allScores[category] || 0;
-                    const isDetected = detectedCategories[category] !== undefined;
-                    const displayName = DETOXIFY_CATEGORIES[category];
-                    
-                    return `
-                    <div class="category-card ${isDetected ? 'detected' : ''}">
-                        <div class="category-name">${displayName}</div>
-                        <div class="category-score ${score > 0.7 ? 'score-high' : 'score-low'}">
-                            ${(score * 100).toFixed(1)}%
-                        </div>
-                        <div class="detection-status ${isDetected ? 'status-detected' : 'status-clean'}">
-                            ${isDetected ? '🚨 Detected' : '✅ Clean'}
-                        </div>
-                    </div>
-                    `;
-                }).join('')}
-            </div>
+            for (const [category, displayName] of CAT_ENTRIES) {
+                const score = allScores[category] || 0;
+                const isDetected = detectedCategories[category] !== undefined;
+                
+                parts.push(isDetected ? '<div class="category-card detected">' : '<div class="category-card">',
+                    '<div class="category-name">', displayName, '</div>',
+                    score > 0.7 ? '<div class="category-score score-high">' : '<div class="category-score score-low">',
+                    formatPercent(score * 100), '</div>',
+                    isDetected
+                        ? '<div class="detection-status status-detected">🚨 Detected</div>'
+                        : '<div class="detection-status status-clean">✅ Clean</div>',
+                    '</div>');
+            }
+            parts.push('</div>');
             
-            ${data.extracted_text ? `
-            <div style="margin-top: 30px;">
-                <h3>📝 Extracted Text</h3>
-                <div class="extracted-text">${data.extracted_text}</div>
-            </div>
-            ` : ''}
-            `;
+            // OCR and speech transcripts are user content, not markup
+            if (data.extracted_text) {
+                parts.push('<div style="margin-top: 30px;"><h3>📝 Extracted Text</h3><div class="extracted-text">',
+                    escapeHTML(data.extracted_text), '</div></div>');
+            }
+            return parts.join('');
         }
         
         function createImageResultsHTML(data) {
@@ -1159,27 +1947,26 @@ frontend_html = """
             const audioVisualizer = document.getElementById('audio-visualizer');
             const analyzeAudioBtn = document.getElementById('analyze-audio-btn');
             
-            function preventDefaults(e) {
-                e.preventDefault();
-                e.stopPropagation();
+            // One handler per drop zone covers every drag event: it stops the
+            // browser from opening the file, toggles the highlight and hands
+            // dropped files to the zone's handler
+            function setupDropZone(dropZone, handleFile) {
+                const onDrag = (e) => {
+                    e.preventDefault();
+                    e.stopPropagation();
+                    if (e.type === 'dragenter' || e.type === 'dragover') {
+                        dropZone.classList.add('dragover');
+                    } else {
+                        dropZone.classList.remove('dragover');
+                    }
+                    if (e.type === 'drop' && e.dataTransfer.files.length > 0) handleFile(e.dataTransfer.files[0]);
+                };
+                ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
+                    dropZone.addEventListener(eventName, onDrag, false);
+                });
             }
             
-            // Drag and drop handlers for image
-            ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
-                dropZoneImage.addEventListener(eventName, preventDefaults, false);
-            });
-            
-            ['dragenter', 'dragover'].forEach(eventName => {
-                dropZoneImage.addEventListener(eventName, () => dropZoneImage.classList.add('dragover'), false);
-            });
-            
-            ['dragleave', 'drop'].forEach(eventName => {
-                dropZoneImage.addEventListener(eventName, () => dropZoneImage.classList.remove('dragover'), false);
-            });
-            
-            dropZoneImage.addEventListener('drop', (e) => {
-                if (e.dataTransfer.files.length > 0) handleImageFile(e.dataTransfer.files[0]);
-            }, false);
+            setupDropZone(dropZoneImage, handleImageFile);
             
             imageInput.addEventListener('change', (e) => {
                 if (e.target.files.length > 0) handleImageFile(e.target.files[0]);
@@ -1192,31 +1979,13 @@ frontend_html = """
                 }
                 currentImage = file;
                 analyzeImageBtn.disabled = false;
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    imagePreview.src = e.target.result;
-                    imagePreview.style.display = 'block';
-                };
-                reader.readAsDataURL(file);
+                imagePreview.onload = () => URL.revokeObjectURL(imagePreview.src);
+                imagePreview.src = URL.createObjectURL(file);
+                imagePreview.style.display = 'block';
                 showAlert('Image ready for analysis!', 'success');
             }
             
-            // Drag and drop handlers for audio
-            ['dragenter', 'dragover', 'dragleave', 'drop'].forEach(eventName => {
-                dropZoneAudio.addEventListener(eventName, preventDefaults, false);
-            });
-            
-            ['dragenter', 'dragover'].forEach(eventName => {
-                dropZoneAudio.addEventListener(eventName, () => dropZoneAudio.classList.add('dragover'), false);
-            });
-            
-            ['dragleave', 'drop'].forEach(eventName => {
-                dropZoneAudio.addEventListener(eventName, () => dropZoneAudio.classList.remove('dragover'), false);
-            });
-            
-            dropZoneAudio.addEventListener('drop', (e) => {
-                if (e.dataTransfer.files.length > 0) handleAudioFile(e.dataTransfer.files[0]);
-            }, false);
+            setupDropZone(dropZoneAudio, handleAudioFile);
             
             audioInput.addEventListener('change', (e) => {
                 if (e.target.files.length > 0) handleAudioFile(e.target.files[0]);
@@ -1229,13 +1998,12 @@ frontend_html = """
                 }
                 currentAudio = file;
                 analyzeAudioBtn.disabled = false;
-                const reader = new FileReader();
-                reader.onload = (e) => {
-                    audioPreview.src = e.target.result;
-                    audioPreview.style.display = 'block';
-                    audioVisualizer.style.display = 'block';
-                };
-                reader.readAsDataURL(file);
+                // The player keeps reading from its URL while seeking, so the
+                // previous one is only revoked once a new file replaces it
+                if (audioPreview.src.startsWith('blob:')) URL.revokeObjectURL(audioPreview.src);
+                audioPreview.src = URL.createObjectURL(file);
+                audioPreview.style.display = 'block';
+                audioVisualizer.style.display = 'block';
                 showAlert('Audio ready for analysis!', 'success');
             }
         }
@@ -1249,10 +2017,12 @@ frontend_html = """
             "insult": "Insults",
             "identity_hate": "Identity Hate"
         };
+        const CAT_ENTRIES = Object.entries(DETOXIFY_CATEGORIES);
         
         // Initialize the application
         document.addEventListener('DOMContentLoaded', function() {
             setupFileUpload();
+            loadHistory();
             showAlert('🚀 SENTRA AI is ready! Choose a tab to start analyzing content.', 'success');
         });
     </script>
@@ -1260,86 +2030,201 @@ frontend_html = """
 </html>
 """
 
+# The page is static: encode and compress it once at startup instead of running
+# it through Jinja on every hit, and let browsers revalidate with an ETag.
+# Variants are listed in server preference order (brotli when installed).
+HOME_HTML = frontend_html.encode('utf-8')
+_home_encodings = {'gzip': gzip.compress(HOME_HTML, 6), 'identity': HOME_HTML}
+if brotli is not None:
+    _home_encodings = {'br': brotli.compress(HOME_HTML, quality=5), **_home_encodings}
+HOME_VARIANTS = {
+    encoding: (body, hashlib.md5(body).hexdigest())
+    for encoding, body in _home_encodings.items()
+}
+HOME_COMPRESSED_ENCODINGS = [encoding for encoding in HOME_VARIANTS if encoding != 'identity']
+
 # ---------------- Flask Routes ----------------
+def json_response(payload, status=200):
+    """Serialize a JSON response with orjson (C, numpy-aware) when it is installed"""
+    if orjson is None:
+        return jsonify(payload), status
+    body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return Response(body, status=status, mimetype='application/json')
+
+@contextmanager
+def upload_view(file_storage):
+    """Zero-copy, read-only view of an uploaded file's bytes for use inside a with-block"""
+    stream = file_storage.stream
+    if isinstance(stream, BytesIO):
+        view = stream.getbuffer()
+        try:
+            yield view
+        finally:
+            # Werkzeug can't close the BytesIO while the buffer is exported
+            view.release()
+        return
+
+    try:
+        stream.flush()
+        fileno = stream.fileno()
+    except (AttributeError, OSError):
+        yield memoryview(stream.read())
+        return
+    if os.fstat(fileno).st_size == 0:
+        yield memoryview(b'')
+        return
+    # Reads go straight to the page cache; the mapping is dropped with its last view
+    yield memoryview(mmap.mmap(fileno, 0, access=mmap.ACCESS_READ))
+
+# Per-type caps, checked against Content-Length before the body is parsed
+MAX_IMAGE_UPLOAD = 8 * 1024 * 1024
+MAX_AUDIO_UPLOAD = 16 * 1024 * 1024
+
+# Magic bytes as (offset, bytes) or (offset, bytes, mask) fields that must all
+# match within the first 12 bytes; a mask is ANDed with the header first
+IMAGE_SIGNATURES = (
+    ((0, b'\xff\xd8\xff'),),           # JPEG
+    ((0, b'\x89PNG\r\n\x1a\n'),),      # PNG
+    ((0, b'GIF8'),),                   # GIF
+    ((0, b'RIFF'), (8, b'WEBP')),      # WebP
+    ((0, b'BM'),),                     # BMP
+)
+AUDIO_SIGNATURES = (
+    ((0, b'RIFF'), (8, b'WAVE')),      # WAV
+    ((0, b'RF64'), (8, b'WAVE')),      # WAV over 4 GB (RF64)
+    ((0, b'ID3'),),                    # MP3 with ID3 tag
+    ((0, b'fLaC'),),                   # FLAC
+    ((4, b'ftyp'),),                   # M4A/MP4
+    # 11-bit frame sync shared by every MPEG audio layer/version (bare MP3,
+    # with or without CRC, MPEG-2.5) and ADTS AAC
+    ((0, b'\xff\xe0', b'\xff\xe0'),),
+)
+
+def _field_matches(head: bytes, offset: int, magic: bytes, mask: bytes = None) -> bool:
+    field = head[offset:offset + len(magic)]
+    if mask is not None:
+        field = bytes(b & m for b, m in zip(field, mask))
+    return field == magic
+
+def has_signature(file_storage, signatures) -> bool:
+    """Sniff the first bytes of an upload against a magic-byte table, then rewind"""
+    head = file_storage.stream.read(12)
+    file_storage.stream.seek(0)
+    return any(all(_field_matches(head, *field) for field in signature)
+               for signature in signatures)
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    # Raised while parsing a body over MAX_CONTENT_LENGTH, which also covers
+    # chunked uploads that skip the per-route Content-Length checks
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return json_response({'error': f'Upload too large (max {limit_mb}MB)'}, 413)
+
 @app.route('/')
 def home():
-    return render_template_string(frontend_html)
+    encoding = request.accept_encodings.best_match(HOME_COMPRESSED_ENCODINGS, default='identity')
+    body, etag = HOME_VARIANTS[encoding]
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.content_encoding = encoding
+    # Werkzeug's conditional handling covers ETag lists, weak tags and '*'
+    # in If-None-Match, answering 304 without a body on a match
+    return response.make_conditional(request)
 
 @app.route('/analyze/text', methods=['POST'])
 def analyze_text_route():
     try:
         data = request.get_json()
         if not data or 'text' not in data:
-            return jsonify({'error': 'No text provided'}), 400
+            return json_response({'error': 'No text provided'}, 400)
         
         text = data['text'].strip()
         if not text:
-            return jsonify({'error': 'Text cannot be empty'}), 400
+            return json_response({'error': 'Text cannot be empty'}, 400)
         
         toxicity_results = analyze_toxicity(text)
-        return jsonify(toxicity_results)
+        return json_response(toxicity_results)
         
+    except RequestEntityTooLarge as e:
+        return request_too_large(e)
+    except (FutureTimeoutError, queue.Full):
+        return json_response({'error': 'Server is busy, please try again'}, 503)
     except Exception as e:
-        return jsonify({'error': f'Text analysis failed: {str(e)}'}), 500
+        return json_response({'error': f'Text analysis failed: {str(e)}'}, 500)
 
 @app.route('/analyze/image', methods=['POST'])
 def analyze_image_route():
     try:
+        if request.content_length is not None and request.content_length > MAX_IMAGE_UPLOAD:
+            return json_response({'error': 'Image too large (max 8MB)'}, 413)
+
         if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
+            return json_response({'error': 'No image file provided'}, 400)
         
         image_file = request.files['image']
         if image_file.filename == '':
-            return jsonify({'error': 'No image selected'}), 400
+            return json_response({'error': 'No image selected'}, 400)
+        
+        if not has_signature(image_file, IMAGE_SIGNATURES):
+            return json_response({'error': 'Unsupported image format. Supported: JPG, PNG, GIF, WEBP, BMP'}, 415)
         
-        extracted_text = extract_text_from_image(image_file.read())
+        with upload_view(image_file) as image_data:
+            extracted_text = extract_text_from_image(image_data)
         
         if extracted_text.startswith('Error') or extracted_text == 'No text detected in image':
-            return jsonify({
-                'extracted_text': extracted_text,
-                'overall_score': 0,
-                'is_toxic': False,
-                'detected_categories': {},
-                'all_scores': {category: 0.0 for category in DETOXIFY_CATEGORIES}
-            })
+            return json_response({**_EMPTY_RESULT, 'extracted_text': extracted_text})
         
         toxicity_results = analyze_toxicity(extracted_text)
         toxicity_results['extracted_text'] = extracted_text
-        return jsonify(toxicity_results)
+        return json_response(toxicity_results)
         
+    except RequestEntityTooLarge as e:
+        return request_too_large(e)
+    except (FutureTimeoutError, queue.Full):
+        return json_response({'error': 'Server is busy, please try again'}, 503)
     except Exception as e:
-        return jsonify({'error': f'Image analysis failed: {str(e)}'}), 500
+        return json_response({'error': f'Image analysis failed: {str(e)}'}, 500)
 
 @app.route('/analyze/audio', methods=['POST'])
 def analyze_audio_route():
     try:
+        if request.content_length is not None and request.content_length > MAX_AUDIO_UPLOAD:
+            return json_response({'error': 'Audio file too large (max 16MB)'}, 413)
+
         if 'audio' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
+            return json_response({'error': 'No audio file provided'}, 400)
         
         audio_file = request.files['audio']
         if audio_file.filename == '':
-            return jsonify({'error': 'No audio selected'}), 400
+            return json_response({'error': 'No audio selected'}, 400)
         
         if not allowed_audio_file(audio_file.filename):
-            return jsonify({'error': 'Invalid audio format. Supported: WAV, MP3, M4A, FLAC, AAC'}), 400
+            return json_response({'error': 'Invalid audio format. Supported: WAV, MP3, M4A, FLAC, AAC'}, 400)
         
-        extracted_text = speech_to_text(audio_file.read(), audio_file.filename)
+        if not has_signature(audio_file, AUDIO_SIGNATURES):
+            return json_response({'error': 'File content is not a supported audio format'}, 415)
         
-        if extracted_text.startswith('Error') or extracted_text == 'Could not understand audio':
-            return jsonify({
-                'extracted_text': extracted_text,
-                'overall_score': 0,
-                'is_toxic': False,
-                'detected_categories': {},
-                'all_scores': {category: 0.0 for category in DETOXIFY_CATEGORIES}
-            })
+        with upload_view(audio_file) as audio_data:
+            extracted_text = speech_to_text(audio_data, audio_file.filename)
+        
+        if (extracted_text.startswith(('Error', 'Audio processing error', 'Speech recognition error'))
+                or extracted_text == 'Could not understand audio'):
+            return json_response({**_EMPTY_RESULT, 'extracted_text': extracted_text})
         
         toxicity_results = analyze_toxicity(extracted_text)
         toxicity_results['extracted_text'] = extracted_text
-        return jsonify(toxicity_results)
+        return json_response(toxicity_results)
         
+    except RequestEntityTooLarge as e:
+        return request_too_large(e)
+    except (FutureTimeoutError, queue.Full):
+        return json_response({'error': 'Server is busy, please try again'}, 503)
     except Exception as e:
-        return jsonify({'error': f'Audio analysis failed: {str(e)}'}), 500
+        return json_response({'error': f'Audio analysis failed: {str(e)}'}, 500)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    app.run(host='0.0.0.0', port=5000, threaded=True)